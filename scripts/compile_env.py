@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Pre-compile the .env file into a Python module.
+Scripts load the generated env_snapshot.py through the import system (and its
+cached .pyc) instead of re-reading and parsing .env on every run.
+
+Usage: python3 scripts/compile_env.py [path/to/.env]
+"""
+
+import os
+import re
+import sys
+from typing import Dict
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_ENV_FILE = os.path.join(SCRIPTS_DIR, '..', '.env')
+SNAPSHOT_FILE = os.path.join(SCRIPTS_DIR, 'env_snapshot.py')
+
+# KEY=value lines of a .env file; comments and blank lines never match
+ENV_LINE = re.compile(r'^[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=[ \t]*(.*?)[ \t]*\r?$', re.MULTILINE)
+
+def parse_env_file(env_file: str) -> Dict[str, str]:
+    """Parse KEY=value pairs from a .env file"""
+    with open(env_file, 'r') as f:
+        return dict(ENV_LINE.findall(f.read()))
+
+def load_env(env_file: str = DEFAULT_ENV_FILE) -> Dict[str, str]:
+    """Load .env values, using the compiled snapshot when it is newer than the file"""
+    try:
+        if os.path.getmtime(SNAPSHOT_FILE) >= os.path.getmtime(env_file):
+            from env_snapshot import ENV
+            return ENV
+    except (OSError, ImportError):
+        pass
+    
+    return parse_env_file(env_file)
+
+def compile_env(env_file: str = DEFAULT_ENV_FILE, snapshot_file: str = SNAPSHOT_FILE):
+    """Write the parsed .env values to a Python module"""
+    env = parse_env_file(env_file)
+    
+    lines = [
+        "# Generated by scripts/compile_env.py - do not edit, do not commit",
+        "from typing import Dict",
+        "",
+        "ENV: Dict[str, str] = {",
+    ]
+    lines.extend(f"    {key!r}: {value!r}," for key, value in env.items())
+    lines.append("}")
+    
+    with open(snapshot_file, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    
+    print(f"📦 Compiled {len(env)} variables from {env_file} into {snapshot_file}")
+
+if __name__ == "__main__":
+    compile_env(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_ENV_FILE)
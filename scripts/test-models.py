@@ -9,13 +9,14 @@ import sys
 import asyncio
 import aiohttp
 import json
+import time
 from typing import Dict, Any
-from datetime import datetime
 
 # Add the griptape service to the path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'services', 'griptape-service', 'src'))
 
-from agent import create_agent_from_env
+from agent import create_agent_from_config, close_session
+from compile_env import load_env
 
 class ModelTester:
     def __init__(self):
@@ -25,13 +26,10 @@ class ModelTester:
         """Test a specific model provider"""
         print(f"\n🧪 Testing {provider_name}...")
         
-        # Set environment variables
-        for key, value in env_vars.items():
-            os.environ[key] = value
-        
         try:
-            # Create agent
-            agent = create_agent_from_env()
+            # Create agent from the provider's variables layered over the environment,
+            # without touching os.environ so providers can be tested concurrently
+            agent = create_agent_from_config({**os.environ, **env_vars})
             
             # Test context
             context = {
@@ -44,13 +42,11 @@ class ModelTester:
             }
             
             # Time the request
-            start_time = datetime.now()
+            start_ns = time.perf_counter_ns()
             
-            async with agent as a:
-                response = await a.process_message(test_message, context)
+            response = await agent.process_message(test_message, context)
             
-            end_time = datetime.now()
-            latency = (end_time - start_time).total_seconds() * 1000
+            latency = (time.perf_counter_ns() - start_ns) / 1_000_000
             
             result = {
                 "provider": provider_name,
@@ -73,17 +69,19 @@ class ModelTester:
             error_msg = str(e)
             print(f"❌ {provider_name} failed: {error_msg}")
             
-            result = {
-                "provider": provider_name,
-                "model": "unknown",
-                "content": "",
-                "tokens": 0,
-                "latency_ms": 0,
-                "success": False,
-                "error": error_msg
-            }
-            
-            return result
+            return self.failure_result(provider_name, error_msg)
+    
+    def failure_result(self, provider_name: str, error_msg: str) -> Dict[str, Any]:
+        """Build the result entry for a provider that failed"""
+        return {
+            "provider": provider_name,
+            "model": "unknown",
+            "content": "",
+            "tokens": 0,
+            "latency_ms": 0,
+            "success": False,
+            "error": error_msg
+        }
     
     async def test_all_providers(self, test_message: str = "Hello! How are you today?"):
         """Test all configured providers"""
@@ -134,14 +132,22 @@ class ModelTester:
             }
         ]
         
-        # Test each provider
+        # Skip providers without an API key, test the rest concurrently
+        configured = []
         for config in test_configs:
-            # Skip if no API key is provided
             if not any(config["env_vars"].values()):
                 print(f"⏭️  Skipping {config['name']} - no API key configured")
                 continue
-            
-            result = await self.test_provider(config["name"], config["env_vars"], test_message)
+            configured.append(config)
+        
+        results = await asyncio.gather(*(
+            self.test_provider(config["name"], config["env_vars"], test_message)
+            for config in configured
+        ), return_exceptions=True)
+        
+        for config, result in zip(configured, results):
+            if isinstance(result, BaseException):
+                result = self.failure_result(config["name"], str(result))
             self.results.append(result)
         
         # Print summary
@@ -179,18 +185,23 @@ async def main():
     # Get test message from command line or use default
     test_message = sys.argv[1] if len(sys.argv) > 1 else "Hello! How are you today?"
     
-    await tester.test_all_providers(test_message)
+    try:
+        await tester.test_all_providers(test_message)
+    finally:
+        await close_session()
 
 if __name__ == "__main__":
     # Check if .env file exists and load it
     env_file = os.path.join(os.path.dirname(__file__), '..', '.env')
     if os.path.exists(env_file):
         print(f"📁 Loading environment from {env_file}")
-        with open(env_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    os.environ[key] = value
+        os.environ.update(load_env(env_file))
+    
+    # uvloop is optional; fall back to the stock event loop without it
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     
     asyncio.run(main()) 
\ No newline at end of file
@@ -1,11 +1,16 @@
 import structlog
 import asyncio
-from typing import Dict, Any, AsyncGenerator, Optional
+from typing import Dict, Any, AsyncGenerator, List, Mapping, Optional, Tuple
+from collections import OrderedDict
+import functools
+import hashlib
+import random
 import time
 import os
 import aiohttp
-import json
-from dataclasses import dataclass
+import orjson
+from dataclasses import dataclass, replace
+from email.utils import parsedate_to_datetime
 from enum import Enum
 import logging
 
@@ -18,7 +23,7 @@ class ModelProvider(Enum):
     TOGETHER = "together"
     SELF_HOSTED = "self-hosted"
 
-@dataclass
+@dataclass(frozen=True)
 class ModelConfig:
     provider: ModelProvider
     model_name: str
@@ -27,6 +32,22 @@ class ModelConfig:
     max_tokens: int = 4000
     temperature: float = 0.7
 
+@functools.lru_cache(maxsize=1)
+def _token_encoding():
+    """Load the BPE encoding once; None when tiktoken is unavailable"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken's native BPE, falling back to a word count"""
+    encoding = _token_encoding()
+    if encoding is None:
+        return len(text.split())
+    return len(encoding.encode_ordinary(text))
+
 class GriptapeAgent:
     def __init__(self):
         self.initialized = False
@@ -35,6 +56,8 @@ class GriptapeAgent:
     async def initialize(self):
         """Initialize the agent"""
         logger.info("Initializing Griptape Agent")
+        # Load the tokenizer now rather than on the first request
+        _token_encoding()
         self.initialized = True
         self.start_time = time.time()
         
@@ -43,9 +66,9 @@ class GriptapeAgent:
         logger.info("Cleaning up Griptape Agent")
         self.initialized = False
         
-    async def process_message(self, message: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    async def process_message(self, message: str, context: Any) -> Dict[str, Any]:
         """Process a message with the agent"""
-        logger.info("Processing message", message=message[:100])
+        logger.info("Processing message: %.100s", message)
         
         # Placeholder response
         return {
@@ -53,14 +76,14 @@ class GriptapeAgent:
             "tools": [],
             "metadata": {
                 "model": "gpt-4",
-                "tokens": len(message.split()),
+                "tokens": count_tokens(message),
                 "latency": 100
             }
         }
         
-    async def process_message_stream(self, message: str, context: Dict[str, Any]) -> AsyncGenerator[str, None]:
+    async def process_message_stream(self, message: str, context: Any) -> AsyncGenerator[str, None]:
         """Process a message with streaming response"""
-        logger.info("Processing message stream", message=message[:100])
+        logger.info("Processing message stream: %.100s", message)
         
         response = f"I received your message: {message}. This is a placeholder streaming response."
         for word in response.split():
@@ -83,330 +106,554 @@ class GriptapeAgent:
         
     async def update_settings(self, settings: Dict[str, Any]):
         """Update agent settings"""
-        logger.info("Updating agent settings", settings=settings)
+        logger.info("Updating agent settings: %s", settings)
+
+# Process-wide HTTP session so every provider call reuses pooled keep-alive connections
+_SESSION: Optional[aiohttp.ClientSession] = None
+_SESSION_LOCK: Optional[asyncio.Lock] = None
+
+async def get_session() -> aiohttp.ClientSession:
+    """Get the shared HTTP session, creating it on first use"""
+    global _SESSION, _SESSION_LOCK
+    if _SESSION is not None and not _SESSION.closed:
+        return _SESSION
+    
+    if _SESSION_LOCK is None:
+        _SESSION_LOCK = asyncio.Lock()
+    
+    async with _SESSION_LOCK:
+        if _SESSION is None or _SESSION.closed:
+            connector = aiohttp.TCPConnector(
+                limit=100,
+                limit_per_host=50,
+                keepalive_timeout=60,
+                ttl_dns_cache=300
+            )
+            _SESSION = aiohttp.ClientSession(connector=connector)
+    return _SESSION
+
+async def close_session():
+    """Close the shared HTTP session"""
+    global _SESSION
+    if _SESSION is not None:
+        await _SESSION.close()
+        _SESSION = None
+
+# Retry policy for transient provider failures (rate limits, 5xx, dropped connections)
+MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Total time a call may spend retrying; kept under the bot's 30 s request timeout,
+# so a Retry-After that would run past it ends the retries
+RETRY_DEADLINE = float(os.getenv("MODEL_RETRY_DEADLINE", "20"))
+
+def _retry_after(response: aiohttp.ClientResponse) -> Optional[float]:
+    """Seconds the provider asked us to wait, from Retry-After (delta-seconds or HTTP date)"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider that keeps failing"""
+
+class CircuitBreaker:
+    """Stops calling a provider after repeated failures until a cool-down has passed"""
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def check(self, label: str):
+        if self.opened_at is not None and time.monotonic() - self.opened_at < self.cooldown:
+            raise CircuitOpenError(f"{label} is unavailable after repeated failures, try again shortly")
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        # After the cool-down one failed trial request re-opens the breaker immediately
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+_breakers: Dict[ModelProvider, CircuitBreaker] = {provider: CircuitBreaker() for provider in ModelProvider}
+
+class ResponseCache:
+    """In-process LRU of model responses keyed by request fingerprint"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return dict(value)
+
+    def set(self, key: str, value: Dict[str, Any]):
+        self._entries[key] = (time.monotonic(), dict(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+# Number of past turns sent to the provider with each message
+HISTORY_WINDOW = 10
+
+_ROLE_SYSTEM = "system"
+_ROLE_USER = "user"
+
+@functools.lru_cache(maxsize=64)
+def _system_message(content: str) -> Dict[str, str]:
+    """Shaped system message, shared across requests since the prompt rarely changes"""
+    return {"role": _ROLE_SYSTEM, "content": content}
+
+def _normalize_text(text: str) -> str:
+    """Collapse case and whitespace so near-duplicate prompts share a cache key"""
+    return " ".join(text.split()).casefold()
+
+def _context_field(context: Any, name: str) -> Any:
+    """Read a field from a plain dict or a model object such as ConversationContext"""
+    if isinstance(context, Mapping):
+        return context.get(name)
+    return getattr(context, name, None)
 
 class BaseModelAgent:
     """Base class for all model agents"""
+
+    # Shared by every provider instance; keys include provider and model
+    _response_cache = ResponseCache(
+        maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    )
+    cache_enabled = os.getenv("SEMANTIC_CACHE", "1") != "0"
+    # Identical requests already on the wire; concurrent callers share one call
+    _inflight: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+    # Optional cross-process tier with async get(key)/set(key, value), e.g. Redis
+    shared_cache = None
+    
+    # Prefix for error messages, e.g. "OpenAI API error: ..."
+    error_label = "Model API"
     
     def __init__(self, config: ModelConfig):
         self.config = config
         self.session = None
     
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        self.session = await get_session()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
-            await self.session.close()
+        # The session is shared across agents; close_session() tears it down
+        pass
     
-    async def process_message(self, message: str, context: Dict[str, Any]) -> Dict[str, Any]:
-        """Process a message and return AI response"""
-        raise NotImplementedError
-
-class OpenAIAgent(BaseModelAgent):
-    """Agent using OpenAI API"""
+    def _build_messages(self, message: str, context: Any) -> List[Dict[str, Any]]:
+        """Pinned system messages, then the last HISTORY_WINDOW turns, then the new message"""
+        history = _context_field(context, "history")
+        user_message = {"role": _ROLE_USER, "content": message}
+        if not history:
+            return [user_message]
+        
+        # Only the turns inside the window get reshaped
+        system = [_system_message(m["content"]) for m in history if m["role"] == _ROLE_SYSTEM]
+        turns = [m for m in history if m["role"] != _ROLE_SYSTEM][-HISTORY_WINDOW:]
+        return [
+            *system,
+            *[{"role": m["role"], "content": m["content"]} for m in turns],
+            user_message
+        ]
     
-    async def process_message(self, message: str, context: Dict[str, Any]) -> Dict[str, Any]:
-        url = f"{self.config.base_url or 'https://api.openai.com'}/v1/chat/completions"
-        
-        headers = {
-            "Authorization": f"Bearer {self.config.api_key}",
-            "Content-Type": "application/json"
+    def _cache_key(self, messages: List[Dict[str, Any]]) -> str:
+        """Fingerprint everything that influences the completion"""
+        payload = {
+            "provider": self.config.provider.value,
+            "model": self.config.model_name,
+            "max_tokens": self.config.max_tokens,
+            "temperature": self.config.temperature,
+            "messages": [[m["role"], _normalize_text(m["content"])] for m in messages]
         }
-        
-        # Build conversation history from context
-        messages = []
-        if context.get("history"):
-            for msg in context["history"][-10:]:  # Last 10 messages
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-        
-        messages.append({"role": "user", "content": message})
-        
-        data = {
+        return hashlib.sha1(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    
+    async def _ensure_session(self):
+        if self.session is None or self.session.closed:
+            self.session = await get_session()
+    
+    def _request_url(self) -> str:
+        raise NotImplementedError
+    
+    def _request_headers(self) -> Dict[str, str]:
+        raise NotImplementedError
+    
+    def _request_body(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
             "model": self.config.model_name,
             "messages": messages,
             "max_tokens": self.config.max_tokens,
             "temperature": self.config.temperature
         }
-        
-        async with self.session.post(url, headers=headers, json=data) as response:
-            result = await response.json()
+    
+    async def process_message(self, message: str, context: Any) -> Dict[str, Any]:
+        """Process a message and return AI response, serving repeats from the cache"""
+        await self._ensure_session()
+        
+        messages = self._build_messages(message, context)
+        if not self.cache_enabled:
+            return await self._do_request(messages)
+        
+        key = self._cache_key(messages)
+        cached = self._response_cache.get(key)
+        if cached is not None:
+            logger.debug("Response cache hit for %s", self.config.provider.value)
+            return cached
+        
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, messages))
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._request_done, key))
+        else:
+            logger.debug("Joining in-flight request for %s", self.config.provider.value)
+        
+        # Shield so one caller being cancelled doesn't cancel the others
+        result = await asyncio.shield(task)
+        return dict(result)
+    
+    async def _fetch(self, key: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Fill a local cache miss from the shared cache, or failing that the provider"""
+        if self.shared_cache is not None:
+            cached = await self.shared_cache.get(key)
+            if cached is not None:
+                logger.debug("Shared cache hit for %s", self.config.provider.value)
+                return cached
+        
+        result = await self._do_request(messages)
+        if self.shared_cache is not None:
+            await self.shared_cache.set(key, result)
+        return result
+    
+    def _request_done(self, key: str, task: "asyncio.Task[Dict[str, Any]]"):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self._response_cache.set(key, task.result())
+    
+    @functools.cached_property
+    def _endpoint(self) -> Tuple[str, Dict[str, str]]:
+        """URL and headers only depend on the config, so build them once per agent"""
+        return self._request_url(), self._request_headers()
+    
+    async def _post(self, data: Dict[str, Any]) -> aiohttp.ClientResponse:
+        """POST with retries and backoff; the caller must release the response"""
+        url, headers = self._endpoint
+        body = orjson.dumps(data)
+        breaker = _breakers[self.config.provider]
+        breaker.check(self.error_label)
+        deadline = time.monotonic() + RETRY_DEADLINE
+        
+        for attempt in range(MAX_RETRIES + 1):
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+            try:
+                response = await self.session.post(url, headers=headers, data=body)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == MAX_RETRIES or time.monotonic() + delay > deadline:
+                    breaker.record_failure()
+                    raise
+                reason = "connection error"
+            else:
+                if response.status not in RETRYABLE_STATUSES:
+                    breaker.record_success()
+                    return response
+                # Never retry sooner than the provider asked
+                wait = _retry_after(response)
+                if wait is not None:
+                    delay = max(delay, wait)
+                if attempt == MAX_RETRIES or time.monotonic() + delay > deadline:
+                    breaker.record_failure()
+                    return response
+                response.release()
+                reason = f"HTTP {response.status}"
+            
+            logger.warning("%s %s, retrying in %.2fs (attempt %d of %d)",
+                           self.error_label, reason, delay, attempt + 1, MAX_RETRIES)
+            await asyncio.sleep(delay)
+    
+    async def _do_request(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Send the messages to the provider and return the parsed response"""
+        async with await self._post(self._request_body(messages)) as response:
+            body = await response.read()
             
             if response.status != 200:
-                logger.error(f"OpenAI API error: {result}")
-                raise Exception(f"OpenAI API error: {result.get('error', {}).get('message', 'Unknown error')}")
+                raise self._api_error(response.status, body)
             
-            return {
-                "content": result["choices"][0]["message"]["content"],
-                "model": self.config.model_name,
-                "tokens": result["usage"]["total_tokens"],
-                "latency": 0  # Could calculate this
-            }
+            return self._parse_response(orjson.loads(body))
+    
+    def _api_error(self, status: int, body: bytes) -> Exception:
+        """Build the exception for a failed call; error bodies aren't always JSON"""
+        try:
+            message = orjson.loads(body).get("error", {}).get("message", "Unknown error")
+        except (orjson.JSONDecodeError, AttributeError):
+            message = body[:500].decode("utf-8", "replace") or "Unknown error"
+        
+        logger.error("%s error (HTTP %s): %s", self.error_label, status, message)
+        return Exception(f"{self.error_label} error: {message}")
+    
+    def _parse_response(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract the reply from an OpenAI-style chat completion"""
+        return {
+            "content": result["choices"][0]["message"]["content"],
+            "model": self.config.model_name,
+            "tokens": result.get("usage", {}).get("total_tokens", 0),
+            "latency": 0
+        }
+    
+    async def process_message_stream(self, message: str, context: Any) -> AsyncGenerator[str, None]:
+        """Process a message and yield the response text as the provider generates it"""
+        await self._ensure_session()
+        
+        messages = self._build_messages(message, context)
+        if self.cache_enabled:
+            cached = self._response_cache.get(self._cache_key(messages))
+            if cached is not None:
+                yield cached["content"]
+                return
+        
+        data = self._request_body(messages)
+        data["stream"] = True
+        
+        async with await self._post(data) as response:
+            if response.status != 200:
+                raise self._api_error(response.status, await response.read())
+            
+            # Some self-hosted backends ignore "stream" and send the whole completion
+            if response.content_type != "text/event-stream":
+                yield self._parse_response(orjson.loads(await response.read()))["content"]
+                return
+            
+            # Server-sent events: one "data: {...}" line per chunk
+            async for line in response.content:
+                if not line.startswith(b"data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == b"[DONE]":
+                    break
+                chunk = orjson.loads(payload)
+                # Failures after the 200 arrive as an error event in the stream
+                if "error" in chunk:
+                    raise self._api_error(response.status, payload)
+                delta = self._stream_delta(chunk)
+                if delta:
+                    yield delta
+    
+    def _stream_delta(self, chunk: Dict[str, Any]) -> Optional[str]:
+        """Extract the text from an OpenAI-style streaming chunk"""
+        choices = chunk.get("choices")
+        if not choices:
+            return None
+        return choices[0].get("delta", {}).get("content")
+
+class OpenAIAgent(BaseModelAgent):
+    """Agent using OpenAI API"""
+    
+    error_label = "OpenAI API"
+    
+    def _request_url(self) -> str:
+        return f"{self.config.base_url or 'https://api.openai.com'}/v1/chat/completions"
+    
+    def _request_headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.config.api_key}",
+            "Content-Type": "application/json"
+        }
 
 class AnthropicAgent(BaseModelAgent):
     """Agent using Anthropic API"""
     
-    async def process_message(self, message: str, context: Dict[str, Any]) -> Dict[str, Any]:
-        url = f"{self.config.base_url or 'https://api.anthropic.com'}/v1/messages"
-        
-        headers = {
+    error_label = "Anthropic API"
+    
+    def _request_url(self) -> str:
+        return f"{self.config.base_url or 'https://api.anthropic.com'}/v1/messages"
+    
+    def _request_headers(self) -> Dict[str, str]:
+        return {
             "x-api-key": self.config.api_key,
             "Content-Type": "application/json",
             "anthropic-version": "2023-06-01"
         }
-        
-        # Build conversation history
-        messages = []
-        if context.get("history"):
-            for msg in context["history"][-10:]:
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-        
-        messages.append({"role": "user", "content": message})
-        
-        data = {
+    
+    def _request_body(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # Anthropic takes the system prompt as a top-level field; marking it
+        # lets the API reuse the cached prefix instead of reprocessing it
+        system = [m["content"] for m in messages if m["role"] == "system"]
+        data = super()._request_body([m for m in messages if m["role"] != "system"])
+        if system:
+            data["system"] = [{
+                "type": "text",
+                "text": "\n\n".join(system),
+                "cache_control": {"type": "ephemeral"}
+            }]
+        return data
+    
+    def _parse_response(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "content": result["content"][0]["text"],
             "model": self.config.model_name,
-            "messages": messages,
-            "max_tokens": self.config.max_tokens,
-            "temperature": self.config.temperature
+            "tokens": result["usage"]["input_tokens"] + result["usage"]["output_tokens"],
+            "latency": 0
         }
-        
-        async with self.session.post(url, headers=headers, json=data) as response:
-            result = await response.json()
-            
-            if response.status != 200:
-                logger.error(f"Anthropic API error: {result}")
-                raise Exception(f"Anthropic API error: {result.get('error', {}).get('message', 'Unknown error')}")
-            
-            return {
-                "content": result["content"][0]["text"],
-                "model": self.config.model_name,
-                "tokens": result["usage"]["input_tokens"] + result["usage"]["output_tokens"],
-                "latency": 0
-            }
+    
+    def _stream_delta(self, chunk: Dict[str, Any]) -> Optional[str]:
+        if chunk.get("type") != "content_block_delta":
+            return None
+        return chunk.get("delta", {}).get("text")
 
 class OpenRouterAgent(BaseModelAgent):
     """Agent using OpenRouter API for access to various models"""
     
-    async def process_message(self, message: str, context: Dict[str, Any]) -> Dict[str, Any]:
-        url = f"{self.config.base_url or 'https://openrouter.ai'}/api/v1/chat/completions"
-        
-        headers = {
+    error_label = "OpenRouter API"
+    
+    def _request_url(self) -> str:
+        return f"{self.config.base_url or 'https://openrouter.ai'}/api/v1/chat/completions"
+    
+    def _request_headers(self) -> Dict[str, str]:
+        return {
             "Authorization": f"Bearer {self.config.api_key}",
             "Content-Type": "application/json",
             "HTTP-Referer": "https://discord-bot-hacking",  # Required by OpenRouter
             "X-Title": "Discord AI Bot"  # Optional but recommended
         }
-        
-        # Build conversation history
-        messages = []
-        if context.get("history"):
-            for msg in context["history"][-10:]:
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-        
-        messages.append({"role": "user", "content": message})
-        
-        data = {
-            "model": self.config.model_name,
-            "messages": messages,
-            "max_tokens": self.config.max_tokens,
-            "temperature": self.config.temperature
-        }
-        
-        async with self.session.post(url, headers=headers, json=data) as response:
-            result = await response.json()
-            
-            if response.status != 200:
-                logger.error(f"OpenRouter API error: {result}")
-                raise Exception(f"OpenRouter API error: {result.get('error', {}).get('message', 'Unknown error')}")
-            
-            return {
-                "content": result["choices"][0]["message"]["content"],
-                "model": self.config.model_name,
-                "tokens": result["usage"]["total_tokens"],
-                "latency": 0
-            }
 
 class TogetherAIAgent(BaseModelAgent):
     """Agent using Together AI API for access to various models"""
     
-    async def process_message(self, message: str, context: Dict[str, Any]) -> Dict[str, Any]:
-        url = f"{self.config.base_url or 'https://api.together.xyz'}/v1/chat/completions"
-        
-        headers = {
+    error_label = "Together AI API"
+    
+    def _request_url(self) -> str:
+        return f"{self.config.base_url or 'https://api.together.xyz'}/v1/chat/completions"
+    
+    def _request_headers(self) -> Dict[str, str]:
+        return {
             "Authorization": f"Bearer {self.config.api_key}",
             "Content-Type": "application/json"
         }
-        
-        # Build conversation history
-        messages = []
-        if context.get("history"):
-            for msg in context["history"][-10:]:
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-        
-        messages.append({"role": "user", "content": message})
-        
-        data = {
-            "model": self.config.model_name,
-            "messages": messages,
-            "max_tokens": self.config.max_tokens,
-            "temperature": self.config.temperature
-        }
-        
-        async with self.session.post(url, headers=headers, json=data) as response:
-            result = await response.json()
-            
-            if response.status != 200:
-                logger.error(f"Together AI API error: {result}")
-                raise Exception(f"Together AI API error: {result.get('error', {}).get('message', 'Unknown error')}")
-            
-            return {
-                "content": result["choices"][0]["message"]["content"],
-                "model": self.config.model_name,
-                "tokens": result["usage"]["total_tokens"],
-                "latency": 0
-            }
 
 class SelfHostedAgent(BaseModelAgent):
     """Agent using your own hosted model"""
     
-    async def process_message(self, message: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    error_label = "Self-hosted model"
+    
+    def _request_url(self) -> str:
         if not self.config.base_url:
             raise ValueError("Self-hosted model requires base_url configuration")
-        
+        return self.config.base_url
+    
+    def _request_headers(self) -> Dict[str, str]:
         headers = {"Content-Type": "application/json"}
         if self.config.api_key:
             headers["Authorization"] = f"Bearer {self.config.api_key}"
-        
-        # Build conversation history
-        messages = []
-        if context.get("history"):
-            for msg in context["history"][-10:]:
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-        
-        messages.append({"role": "user", "content": message})
-        
-        data = {
-            "model": self.config.model_name,
-            "messages": messages,
-            "max_tokens": self.config.max_tokens,
-            "temperature": self.config.temperature
-        }
-        
-        async with self.session.post(self.config.base_url, headers=headers, json=data) as response:
-            result = await response.json()
-            
-            if response.status != 200:
-                logger.error(f"Self-hosted model error: {result}")
-                raise Exception(f"Self-hosted model error: {result.get('error', {}).get('message', 'Unknown error')}")
-            
-            return {
-                "content": result["choices"][0]["message"]["content"],
-                "model": self.config.model_name,
-                "tokens": result.get("usage", {}).get("total_tokens", 0),
-                "latency": 0
-            }
+        return headers
 
-def create_agent_from_env() -> BaseModelAgent:
-    """Create agent based on environment variables"""
-    provider_str = os.getenv("MODEL_PROVIDER", "openai").lower()
+@dataclass(frozen=True)
+class ProviderSpec:
+    """How to build an agent for a provider from environment variables"""
+    agent_cls: type
+    api_key_env: str
+    required_env: str
+    model_env: Optional[str] = None
+    base_url_env: Optional[str] = None
+
+PROVIDER_TABLE: Dict[ModelProvider, ProviderSpec] = {
+    ModelProvider.OPENAI: ProviderSpec(OpenAIAgent, "OPENAI_API_KEY", "OPENAI_API_KEY"),
+    ModelProvider.ANTHROPIC: ProviderSpec(AnthropicAgent, "ANTHROPIC_API_KEY", "ANTHROPIC_API_KEY"),
+    ModelProvider.OPENROUTER: ProviderSpec(
+        OpenRouterAgent, "OPENROUTER_API_KEY", "OPENROUTER_API_KEY", model_env="OPENROUTER_MODEL"
+    ),
+    ModelProvider.TOGETHER: ProviderSpec(
+        TogetherAIAgent, "TOGETHER_API_KEY", "TOGETHER_API_KEY", model_env="TOGETHER_MODEL"
+    ),
+    ModelProvider.SELF_HOSTED: ProviderSpec(
+        SelfHostedAgent, "SELF_HOSTED_API_KEY", "SELF_HOSTED_MODEL_URL", base_url_env="SELF_HOSTED_MODEL_URL"
+    ),
+}
+
+# Every variable that can influence the agent configuration
+_CONFIG_ENV_VARS: Tuple[str, ...] = tuple(sorted(
+    {"MODEL_PROVIDER", "MODEL_NAME", "MAX_TOKENS", "TEMPERATURE"}
+    | {
+        name
+        for spec in PROVIDER_TABLE.values()
+        for name in (spec.api_key_env, spec.required_env, spec.model_env, spec.base_url_env)
+        if name
+    }
+))
+
+def _env_snapshot(env: Mapping[str, str]) -> Tuple[Tuple[str, Optional[str]], ...]:
+    return tuple((name, env.get(name)) for name in _CONFIG_ENV_VARS)
+
+@functools.lru_cache(maxsize=32)
+def _config_from_snapshot(snapshot: Tuple[Tuple[str, Optional[str]], ...]) -> Tuple[ProviderSpec, ModelConfig]:
+    """Parse and validate the configuration once per distinct environment"""
+    env = dict(snapshot)
+    provider_str = (env["MODEL_PROVIDER"] or "openai").lower()
     
     try:
         provider = ModelProvider(provider_str)
     except ValueError:
         raise ValueError(f"Unsupported model provider: {provider_str}")
     
-    # Get common configuration
-    model_name = os.getenv("MODEL_NAME", "gpt-4")
-    max_tokens = int(os.getenv("MAX_TOKENS", "4000"))
-    temperature = float(os.getenv("TEMPERATURE", "0.7"))
+    spec = PROVIDER_TABLE[provider]
+    if not env[spec.required_env]:
+        raise ValueError(f"{spec.required_env} environment variable is required")
     
-    if provider == ModelProvider.OPENAI:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is required")
-        
-        return OpenAIAgent(ModelConfig(
-            provider=provider,
-            model_name=model_name,
-            api_key=api_key,
-            max_tokens=max_tokens,
-            temperature=temperature
-        ))
-    
-    elif provider == ModelProvider.ANTHROPIC:
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key:
-            raise ValueError("ANTHROPIC_API_KEY environment variable is required")
-        
-        return AnthropicAgent(ModelConfig(
-            provider=provider,
-            model_name=model_name,
-            api_key=api_key,
-            max_tokens=max_tokens,
-            temperature=temperature
-        ))
-    
-    elif provider == ModelProvider.OPENROUTER:
-        api_key = os.getenv("OPENROUTER_API_KEY")
-        model_name = os.getenv("OPENROUTER_MODEL", model_name)
-        if not api_key:
-            raise ValueError("OPENROUTER_API_KEY environment variable is required")
-        
-        return OpenRouterAgent(ModelConfig(
-            provider=provider,
-            model_name=model_name,
-            api_key=api_key,
-            max_tokens=max_tokens,
-            temperature=temperature
-        ))
-    
-    elif provider == ModelProvider.TOGETHER:
-        api_key = os.getenv("TOGETHER_API_KEY")
-        model_name = os.getenv("TOGETHER_MODEL", model_name)
-        if not api_key:
-            raise ValueError("TOGETHER_API_KEY environment variable is required")
-        
-        return TogetherAIAgent(ModelConfig(
-            provider=provider,
-            model_name=model_name,
-            api_key=api_key,
-            max_tokens=max_tokens,
-            temperature=temperature
-        ))
-    
-    elif provider == ModelProvider.SELF_HOSTED:
-        model_url = os.getenv("SELF_HOSTED_MODEL_URL")
-        api_key = os.getenv("SELF_HOSTED_API_KEY")
-        if not model_url:
-            raise ValueError("SELF_HOSTED_MODEL_URL environment variable is required")
-        
-        return SelfHostedAgent(ModelConfig(
-            provider=provider,
-            model_name=model_name,
-            api_key=api_key or "",
-            base_url=model_url,
-            max_tokens=max_tokens,
-            temperature=temperature
-        ))
-    
-    else:
-        raise ValueError(f"Unsupported provider: {provider}")
+    model_name = env["MODEL_NAME"] or "gpt-4"
+    if spec.model_env:
+        model_name = env[spec.model_env] or model_name
+    
+    return spec, ModelConfig(
+        provider=provider,
+        model_name=model_name,
+        api_key=env[spec.api_key_env] or "",
+        base_url=env[spec.base_url_env] if spec.base_url_env else None,
+        max_tokens=int(env["MAX_TOKENS"] or "4000"),
+        temperature=float(env["TEMPERATURE"] or "0.7")
+    )
+
+def create_agent_from_config(env: Mapping[str, str]) -> BaseModelAgent:
+    """Create agent from an explicit mapping of configuration variables"""
+    spec, config = _config_from_snapshot(_env_snapshot(env))
+    return spec.agent_cls(config)
+
+def create_agent_from_env() -> BaseModelAgent:
+    """Create agent based on environment variables"""
+    return create_agent_from_config(os.environ)
+
+# Summaries use a cheaper model and a small output budget when configured
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL")
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "256"))
+
+SUMMARY_PROMPT = (
+    "Summarize the following conversation in a few sentences. Keep names, "
+    "decisions and open questions; omit pleasantries.\n\n"
+)
 
 # Main agent class that uses the environment-based configuration
 class Agent:
@@ -414,11 +661,51 @@ class Agent:
     
     def __init__(self):
         self.agent = create_agent_from_env()
-        logger.info(f"Initialized agent with provider: {self.agent.config.provider.value}")
+        self._summary_agent: Optional[BaseModelAgent] = None
+        self._entered = False
+        logger.info("Initialized agent with provider: %s", self.agent.config.provider.value)
     
-    async def process_message(self, message: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    async def start(self):
+        """Open the model agent's HTTP session for the lifetime of this agent"""
+        await self.agent.__aenter__()
+        self._entered = True
+    
+    def set_shared_cache(self, cache):
+        """Share cached responses across workers through an external store"""
+        self.agent.shared_cache = cache
+    
+    async def close(self):
+        """Release the model agent and close the shared HTTP session"""
+        if self._entered:
+            await self.agent.__aexit__(None, None, None)
+            self._entered = False
+        await close_session()
+    
+    async def process_message(self, message: str, context: Any) -> Dict[str, Any]:
         """Process a message using the configured model agent"""
-        async with self.agent as agent:
-            return await agent.process_message(message, context)
+        if not self._entered:
+            await self.start()
+        return await self.agent.process_message(message, context)
+    
+    async def process_message_stream(self, message: str, context: Any) -> AsyncGenerator[str, None]:
+        """Stream a response using the configured model agent"""
+        if not self._entered:
+            await self.start()
+        async for delta in self.agent.process_message_stream(message, context):
+            yield delta
+    
+    async def summarize(self, turns: List[Dict[str, Any]]) -> str:
+        """Condense conversation turns into a short summary"""
+        if self._summary_agent is None:
+            config = self.agent.config
+            self._summary_agent = type(self.agent)(replace(
+                config,
+                model_name=SUMMARY_MODEL or config.model_name,
+                max_tokens=SUMMARY_MAX_TOKENS
+            ))
+        
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        response = await self._summary_agent.process_message(SUMMARY_PROMPT + transcript, {})
+        return response["content"]
 
 # ... existing code ... 
\ No newline at end of file
@@ -0,0 +1,34 @@
+import structlog
+import os
+from typing import Dict, Any, Optional
+import orjson
+import redis.asyncio as redis
+
+logger = structlog.get_logger()
+
+class RedisResponseCache:
+    """Model responses shared by every worker; Redis failures count as misses"""
+        
+    def __init__(self, client: redis.Redis, ttl: int = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))):
+        self.client = client
+        self.ttl = ttl
+        
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            blob = await self.client.get(f"llm:exact:{key}")
+        except redis.RedisError as e:
+            logger.warning("Response cache read failed", error=str(e))
+            return None
+        if blob is None:
+            return None
+        try:
+            return orjson.loads(blob)
+        except orjson.JSONDecodeError as e:
+            logger.warning("Response cache entry unreadable", error=str(e))
+            return None
+        
+    async def set(self, key: str, value: Dict[str, Any]):
+        try:
+            await self.client.set(f"llm:exact:{key}", orjson.dumps(value), ex=self.ttl)
+        except redis.RedisError as e:
+            logger.warning("Response cache write failed", error=str(e))
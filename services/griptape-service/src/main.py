@@ -1,16 +1,20 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+import asyncio
 import structlog
+import orjson
+import logging
 import os
-from typing import Dict, Any, List
-import json
+from typing import Dict, Any, List, Optional, Tuple
 import time
 
 from .agent import Agent
+from .cache import RedisResponseCache
 from .memory import MemoryManager
 from .tools import ToolManager
 from .models import (
+    ConversationContext,
     ProcessRequest,
     ProcessResponse,
     ToolExecuteRequest,
@@ -19,22 +23,20 @@ from .models import (
     ServiceStatus
 )
 
-# Configure logging
+# Configure logging: structlog writes rendered bytes straight to stdout,
+# bypassing the stdlib logging machinery
 structlog.configure(
     processors=[
-        structlog.stdlib.filter_by_level,
-        structlog.stdlib.add_logger_name,
-        structlog.stdlib.add_log_level,
-        structlog.stdlib.PositionalArgumentsFormatter(),
+        structlog.processors.add_log_level,
         structlog.processors.TimeStamper(fmt="iso"),
         structlog.processors.StackInfoRenderer(),
         structlog.processors.format_exc_info,
-        structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer()
+        structlog.processors.JSONRenderer(serializer=orjson.dumps)
     ],
-    context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
+    logger_factory=structlog.BytesLoggerFactory(),
+    wrapper_class=structlog.make_filtering_bound_logger(
+        logging.getLevelName(os.getenv("LOG_LEVEL", "info").upper())
+    ),
     cache_logger_on_first_use=True,
 )
 
@@ -44,7 +46,8 @@ logger = structlog.get_logger()
 app = FastAPI(
     title="Griptape AI Service",
     description="AI service for Discord bot using Griptape framework",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -56,172 +59,209 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-agent = Agent()
-memory_manager = MemoryManager()
-tool_manager = ToolManager()
+# Upper bound on concurrent provider calls within one /process/batch request
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Health payload is constant apart from the timings, so it is pre-serialized
+_START_TIME = time.time()
+_HEALTH_TEMPLATE = (
+    b'{"status":"healthy","uptime":%f,"last_check":%f,"errors":[],'
+    b'"metrics":{"requestsPerMinute":0,"averageLatency":0,"errorRate":0}}'
+)
+
+# Server-sent event framing for /process/stream, kept as bytes
+_SSE_PRE = b"data: "
+_SSE_SUF = b"\n\n"
+_DONE = b"data: [DONE]\n\n"
+
+# Services are created in each worker's startup rather than at import time and
+# shared by every request in that worker; the accessors are async so FastAPI
+# resolves them on the event loop instead of a thread pool
+async def get_agent(request: Request) -> Agent:
+    return request.app.state.agent
+
+async def get_memory_manager(request: Request) -> MemoryManager:
+    return request.app.state.memory_manager
+
+async def get_tool_manager(request: Request) -> ToolManager:
+    return request.app.state.tool_manager
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
     logger.info("Starting Griptape AI Service")
+    agent = app.state.agent = Agent()
+    memory_manager = app.state.memory_manager = MemoryManager(summarizer=agent.summarize)
+    tool_manager = app.state.tool_manager = ToolManager()
+    await agent.start()
     await memory_manager.initialize()
     await tool_manager.initialize()
+    if memory_manager.redis:
+        agent.set_shared_cache(RedisResponseCache(memory_manager.redis))
     logger.info("Griptape AI Service started successfully")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down Griptape AI Service")
-    await memory_manager.cleanup()
-    await tool_manager.cleanup()
+    await app.state.memory_manager.cleanup()
+    await app.state.tool_manager.cleanup()
+    await app.state.agent.close()
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
-    try:
-        return HealthResponse(
-            status="healthy",
-            uptime=time.time(),
-            last_check=time.time(),
-            errors=[],
-            metrics={
-                "requestsPerMinute": 0,
-                "averageLatency": 0,
-                "errorRate": 0
-            }
-        )
-    except Exception as e:
-        logger.error("Health check failed", error=str(e))
-        return HealthResponse(
-            status="unhealthy",
-            uptime=0,
-            last_check=time.time(),
-            errors=[str(e)],
-            metrics={
-                "requestsPerMinute": 0,
-                "averageLatency": 0,
-                "errorRate": 100
-            }
-        )
+    now = time.time()
+    return Response(content=_HEALTH_TEMPLATE % (now - _START_TIME, now), media_type="application/json")
 
-@app.post("/process", response_model=ProcessResponse)
-async def process_message(request: ProcessRequest):
-    """Process a message with the AI agent"""
-    try:
-        start_time = time.time()
-        
-        # Get or create conversation context
+async def _handle_process(
+    request: ProcessRequest,
+    agent: Agent,
+    memory_manager: MemoryManager,
+    context: Optional[ConversationContext] = None,
+    save: bool = True
+) -> ProcessResponse:
+    """Run one message through the agent and record the exchange in its context"""
+    start_ns = time.perf_counter_ns()
+    
+    # Get or create conversation context
+    if context is None:
         context = await memory_manager.get_context(
             request.context.userId,
             request.context.channelId
         )
-        
-        # Update context with new message
-        context.history.append({
-            "role": "user",
-            "content": request.message,
-            "timestamp": time.time(),
-            "metadata": {"interactionType": request.context.interactionType}
-        })
-        
-        # Process with agent
-        response = await agent.process_message(request.message, context.dict())
-        
-        # Update context with response
-        context.history.append({
-            "role": "assistant",
-            "content": response["content"],
-            "timestamp": time.time(),
-            "metadata": {
-                "tools": response.get("tools", []),
-                "interactionType": request.context.interactionType
-            }
-        })
-        
-        # Save updated context
+    
+    # Process with agent; the history sent to it excludes the new message,
+    # which the agent appends itself
+    response = await agent.process_message(request.message, context)
+    
+    # Record both turns of the exchange
+    now = time.time()
+    meta = {"interactionType": request.context.interactionType}
+    tools = response.get("tools", [])
+    context.history.extend((
+        {"role": "user", "content": request.message, "timestamp": now, "metadata": meta},
+        {"role": "assistant", "content": response["content"], "timestamp": now, "metadata": {**meta, "tools": tools}}
+    ))
+    
+    # Save updated context; a batch saves all of its contexts together instead
+    if save:
         await memory_manager.save_context(context)
-        
-        latency = (time.time() - start_time) * 1000
-        
-        return ProcessResponse(
-            content=response["content"],
-            tools=response.get("tools", []),
-            context=context,
-            metadata={
-                "model": response.get("model", "unknown"),
-                "tokens": response.get("tokens", 0),
-                "latency": latency
-            }
-        )
-        
+    
+    latency = (time.perf_counter_ns() - start_ns) / 1_000_000
+    
+    # Every field comes from validated or agent-built data, so skip re-validation
+    return ProcessResponse.model_construct(
+        content=response["content"],
+        tools=tools,
+        context=context,
+        metadata={
+            "model": response.get("model", "unknown"),
+            "tokens": response.get("tokens", 0),
+            "latency": latency
+        }
+    )
+
+@app.post("/process", response_model=ProcessResponse)
+async def process_message(
+    request: ProcessRequest,
+    agent: Agent = Depends(get_agent),
+    memory_manager: MemoryManager = Depends(get_memory_manager)
+):
+    """Process a message with the AI agent"""
+    try:
+        result = await _handle_process(request, agent, memory_manager)
+        return ORJSONResponse(content=result.model_dump())
     except Exception as e:
         logger.error("Error processing message", error=str(e), message=request.message)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/process/stream")
-async def process_message_stream(request: ProcessRequest):
+async def process_message_stream(request: ProcessRequest, agent: Agent = Depends(get_agent)):
     """Process a message with streaming response"""
-    try:
-        async def generate():
-            # For now, return a simple streaming response
-            # In a real implementation, you'd want to implement streaming for each provider
-            response = await agent.process_message(request.message, request.context.dict())
-            yield f"data: {json.dumps({'content': response['content']})}\n\n"
-            yield "data: [DONE]\n\n"
-        
-        return StreamingResponse(
-            generate(),
-            media_type="text/plain",
-            headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
-        )
-        
-    except Exception as e:
-        logger.error("Error processing message stream", error=str(e))
-        raise HTTPException(status_code=500, detail=str(e))
+    async def generate():
+        # Forward provider deltas as server-sent events as soon as they arrive
+        try:
+            async for delta in agent.process_message_stream(request.message, request.context):
+                yield _SSE_PRE + orjson.dumps({"content": delta}) + _SSE_SUF
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            logger.error("Error processing message stream", error=str(e))
+            yield _SSE_PRE + orjson.dumps({"error": str(e)}) + _SSE_SUF
+        yield _DONE
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
+    )
 
 @app.post("/process/batch", response_model=List[ProcessResponse])
-async def process_batch(request: List[ProcessRequest]):
+async def process_batch(
+    request: List[ProcessRequest],
+    agent: Agent = Depends(get_agent),
+    memory_manager: MemoryManager = Depends(get_memory_manager)
+):
     """Process multiple messages in batch"""
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    # Items for the same conversation run in order on one shared context, so
+    # each sees the exchanges before it; different conversations run concurrently
+    groups: Dict[Tuple[str, str], List[int]] = {}
+    for i, req in enumerate(request):
+        groups.setdefault((req.context.userId, req.context.channelId), []).append(i)
+    
     try:
-        responses = []
-        for req in request:
-            response = await process_message(req)
-            responses.append(response)
-        return responses
-        
+        contexts = await memory_manager.get_contexts(list(groups))
     except Exception as e:
         logger.error("Error processing batch", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
+    
+    results: List[Any] = [None] * len(request)
+    
+    async def process_group(indices: List[int], context: ConversationContext):
+        # Let every item finish so one failure doesn't strand in-flight provider calls
+        for i in indices:
+            try:
+                async with semaphore:
+                    results[i] = await _handle_process(request[i], agent, memory_manager, context, save=False)
+            except Exception as e:
+                results[i] = e
+    
+    await asyncio.gather(*map(process_group, groups.values(), contexts))
+    # Exchanges that succeeded are kept even if other items failed
+    await memory_manager.save_contexts(contexts)
+    
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        detail = str(errors[0])
+        logger.error("Error processing batch", error=detail, failed=len(errors), total=len(results))
+        raise HTTPException(status_code=500, detail=detail)
+    
+    return ORJSONResponse(content=[result.model_dump() for result in results])
 
 @app.post("/tools/execute", response_model=ToolExecuteResponse)
-async def execute_tool(request: ToolExecuteRequest):
+async def execute_tool(request: ToolExecuteRequest, tool_manager: ToolManager = Depends(get_tool_manager)):
     """Execute a specific tool"""
     try:
         result = await tool_manager.execute_tool(request.tool, request.parameters)
-        return ToolExecuteResponse(
-            name=result.name,
-            input=result.input,
-            output=result.output,
-            success=result.success,
-            error=result.error
-        )
+        return ToolExecuteResponse(**result)
         
     except Exception as e:
         logger.error("Error executing tool", error=str(e), tool=request.tool)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/tools", response_model=List[Dict[str, Any]])
-async def get_available_tools():
+async def get_available_tools(tool_manager: ToolManager = Depends(get_tool_manager)):
     """Get list of available tools"""
     try:
-        return tool_manager.get_available_tools()
+        return Response(content=tool_manager.get_available_tools_json(), media_type="application/json")
     except Exception as e:
         logger.error("Error getting tools", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/context/{user_id}/{channel_id}")
-async def get_context(user_id: str, channel_id: str):
+async def get_context(user_id: str, channel_id: str, memory_manager: MemoryManager = Depends(get_memory_manager)):
     """Get conversation context for a user and channel"""
     try:
         context = await memory_manager.get_context(user_id, channel_id)
@@ -231,17 +271,17 @@ async def get_context(user_id: str, channel_id: str):
         raise HTTPException(status_code=404, detail="Context not found")
 
 @app.put("/context/{user_id}/{channel_id}")
-async def update_context(user_id: str, channel_id: str, context: Dict[str, Any]):
+async def update_context(user_id: str, channel_id: str, context: Dict[str, Any], memory_manager: MemoryManager = Depends(get_memory_manager)):
     """Update conversation context"""
     try:
-        await memory_manager.save_context(context)
+        await memory_manager.save_context(ConversationContext.model_validate(context))
         return {"status": "updated"}
     except Exception as e:
         logger.error("Error updating context", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/context/{user_id}/{channel_id}")
-async def delete_context(user_id: str, channel_id: str):
+async def delete_context(user_id: str, channel_id: str, memory_manager: MemoryManager = Depends(get_memory_manager)):
     """Delete conversation context"""
     try:
         await memory_manager.delete_context(user_id, channel_id)
@@ -251,7 +291,7 @@ async def delete_context(user_id: str, channel_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/memory")
-async def save_to_memory(data: Dict[str, Any]):
+async def save_to_memory(data: Dict[str, Any], memory_manager: MemoryManager = Depends(get_memory_manager)):
     """Save data to memory"""
     try:
         await memory_manager.save(data["key"], data["value"])
@@ -261,7 +301,7 @@ async def save_to_memory(data: Dict[str, Any]):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/memory/{key}")
-async def get_from_memory(key: str):
+async def get_from_memory(key: str, memory_manager: MemoryManager = Depends(get_memory_manager)):
     """Get data from memory"""
     try:
         value = await memory_manager.get(key)
@@ -275,7 +315,7 @@ async def get_from_memory(key: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/memory/{key}")
-async def delete_from_memory(key: str):
+async def delete_from_memory(key: str, memory_manager: MemoryManager = Depends(get_memory_manager)):
     """Delete data from memory"""
     try:
         await memory_manager.delete(key)
@@ -285,7 +325,7 @@ async def delete_from_memory(key: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/settings")
-async def update_settings(settings: Dict[str, Any]):
+async def update_settings(settings: Dict[str, Any], agent: Agent = Depends(get_agent)):
     """Update agent settings"""
     try:
         await agent.update_settings(settings)
@@ -296,4 +336,14 @@ async def update_settings(settings: Dict[str, Any]):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    # Import string so uvicorn can spawn workers; "auto" picks uvloop and httptools
+    # when installed; structlog handles logging
+    uvicorn.run(
+        "src.main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="auto",
+        workers=int(os.getenv("WORKERS", "4")),
+        log_config=None
+    ) 
\ No newline at end of file
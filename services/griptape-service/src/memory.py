@@ -1,30 +1,93 @@
 import structlog
+import asyncio
+import hashlib
+import os
 import time
-from typing import Dict, Any
-import json
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Tuple
+import msgspec
+import orjson
+import redis.asyncio as redis
+
+from .models import ConversationContext
 
 logger = structlog.get_logger()
 
+# How long cached conversations and memory entries live in Redis (seconds)
+MEMORY_TTL = int(os.getenv("MEMORY_TTL", "86400"))
+
+# History entries kept verbatim; once exceeded, older turns are folded into a summary
+# in the background (or dropped when there is no summarizer)
+MAX_RAW_TURNS = int(os.getenv("MAX_RAW_TURNS", "16"))
+
+# Times a compaction re-reads the history after a concurrent save before giving up
+COMPACTION_ATTEMPTS = 3
+
+Summarizer = Callable[[List[Dict[str, Any]]], Awaitable[str]]
+
+class StoredContext(msgspec.Struct):
+    """Redis copy of ConversationContext"""
+    userId: str
+    channelId: str
+    interactionType: str
+    guildId: Optional[str] = None
+    history: List[Dict[str, Any]] = []
+    tools: List[str] = []
+    preferences: Dict[str, Any] = {}
+    timestamp: float = 0.0
+
+_context_encoder = msgspec.msgpack.Encoder()
+_context_decoder = msgspec.msgpack.Decoder(StoredContext)
+
 class MemoryManager:
-    def __init__(self):
+    def __init__(self, summarizer: Optional[Summarizer] = None):
         self.initialized = False
+        self.redis: Optional[redis.Redis] = None
+        # Condenses old turns when history grows past MAX_RAW_TURNS; without it they are dropped
+        self.summarizer = summarizer
+        # "user:channel" -> background compaction of the stored history
+        self._compactions: Dict[str, "asyncio.Task[None]"] = {}
         
     async def initialize(self):
         """Initialize the memory manager"""
         logger.info("Initializing Memory Manager")
+        
+        redis_url = os.getenv("REDIS_URL")
+        if redis_url:
+            client = redis.from_url(redis_url)
+            try:
+                await client.ping()
+                self.redis = client
+            except (redis.RedisError, OSError) as e:
+                logger.warning("Redis unavailable, memory will not be cached", error=str(e))
+                await client.close()
+        
         self.initialized = True
         
     async def cleanup(self):
         """Cleanup the memory manager"""
         logger.info("Cleaning up Memory Manager")
+        for task in list(self._compactions.values()):
+            task.cancel()
+        if self.redis:
+            await self.redis.close()
+            self.redis = None
         self.initialized = False
         
-    async def get_context(self, user_id: str, channel_id: str) -> Dict[str, Any]:
-        """Get conversation context"""
-        logger.info("Getting context", user_id=user_id, channel_id=channel_id)
+    @staticmethod
+    def _context_key(user_id: str, channel_id: str) -> str:
+        return f"{user_id}:{channel_id}"
         
-        # Placeholder context
-        return {
+    @staticmethod
+    def _prefix_hash(history: List[Dict[str, Any]]) -> Optional[str]:
+        """SHA-256 over the (role, content) of every history entry"""
+        if not history:
+            return None
+        return hashlib.sha256(orjson.dumps([(entry["role"], entry["content"]) for entry in history])).hexdigest()
+        
+    @staticmethod
+    def _default_context(user_id: str, channel_id: str) -> ConversationContext:
+        """Fresh context for a conversation with nothing stored yet"""
+        return ConversationContext(**{
             "userId": user_id,
             "channelId": channel_id,
             "interactionType": "message",
@@ -41,25 +104,208 @@ class MemoryManager:
                 }
             },
             "timestamp": time.time()
-        }
+        })
+        
+    @staticmethod
+    def _encode_context(context: ConversationContext) -> bytes:
+        return _context_encoder.encode(StoredContext(
+            userId=context.userId,
+            channelId=context.channelId,
+            interactionType=context.interactionType,
+            guildId=context.guildId,
+            history=context.history,
+            tools=context.tools,
+            preferences=context.preferences,
+            timestamp=context.timestamp
+        ))
+        
+    @staticmethod
+    def _decode_context(blob: bytes) -> Optional[ConversationContext]:
+        """Rebuild a stored context; the blob was validated before it was saved"""
+        try:
+            stored = _context_decoder.decode(blob)
+        except msgspec.DecodeError:
+            # Written in an older format; treat as a miss
+            return None
+        return ConversationContext.model_construct(**msgspec.structs.asdict(stored))
+        
+    def _finish_context(self, user_id: str, channel_id: str, blob: Optional[bytes]) -> ConversationContext:
+        context = self._decode_context(blob) if blob else None
+        if context is None:
+            context = self._default_context(user_id, channel_id)
+        return context
+        
+    async def _summarize(self, turns: List[Dict[str, Any]]) -> str:
+        """Summarize turns, reusing the summary of an identical run of turns"""
+        key = f"memory:summary:{self._prefix_hash(turns)}"
+        try:
+            cached = await self.redis.get(key)
+            if cached is not None:
+                return cached.decode()
+        except redis.RedisError as e:
+            logger.warning("Redis read failed", error=str(e))
+        
+        summary = await self.summarizer(turns)
+        try:
+            await self.redis.set(key, summary, ex=MEMORY_TTL)
+        except redis.RedisError as e:
+            logger.warning("Redis write failed", error=str(e))
+        return summary
         
-    async def save_context(self, context: Dict[str, Any]):
+    @staticmethod
+    def _truncate_history(context: ConversationContext):
+        """Drop all but the newest MAX_RAW_TURNS / 2 entries once history passes MAX_RAW_TURNS"""
+        if len(context.history) > MAX_RAW_TURNS:
+            context.history = context.history[-(MAX_RAW_TURNS // 2):]
+        
+    def _schedule_compaction(self, context: ConversationContext):
+        """Summarize the stored history in the background once it passes MAX_RAW_TURNS"""
+        key = self._context_key(context.userId, context.channelId)
+        if not self.redis or len(context.history) <= MAX_RAW_TURNS or key in self._compactions:
+            return
+        
+        old = context.history[:-(MAX_RAW_TURNS // 2)]
+        task = asyncio.create_task(self._compact_stored(key, old))
+        self._compactions[key] = task
+        task.add_done_callback(lambda _: self._compactions.pop(key, None))
+        
+    async def _compact_stored(self, key: str, old: List[Dict[str, Any]]):
+        """Replace the oldest stored entries with one summary entry, if they are still there"""
+        try:
+            summary = await self._summarize(old)
+        except Exception as e:
+            logger.warning("Summarizing history failed, truncating", error=str(e))
+            summary = None
+        
+        stored_key = f"memory:{key}"
+        old_hash = self._prefix_hash(old)
+        try:
+            async with self.redis.pipeline() as pipe:
+                for _ in range(COMPACTION_ATTEMPTS):
+                    try:
+                        # A save landing between the read and the write aborts the write
+                        await pipe.watch(stored_key)
+                        context = self._decode_context(await pipe.get(stored_key) or b"")
+                        # Skip if another worker or a PUT rewrote the history meanwhile
+                        if context is None or self._prefix_hash(context.history[:len(old)]) != old_hash:
+                            return
+                        
+                        recent = context.history[len(old):]
+                        if summary is None:
+                            context.history = recent
+                        else:
+                            context.history = [{
+                                "role": "system",
+                                "content": f"Summary of the earlier conversation: {summary}",
+                                "timestamp": old[-1].get("timestamp", time.time()),
+                                "metadata": {"summary": True}
+                            }, *recent]
+                        pipe.multi()
+                        pipe.set(stored_key, self._encode_context(context), ex=MEMORY_TTL)
+                        await pipe.execute()
+                        return
+                    except redis.WatchError:
+                        continue
+            logger.info("History kept changing, compaction skipped", key=key)
+        except redis.RedisError as e:
+            logger.warning("Redis write failed", error=str(e))
+        
+    async def get_context(self, user_id: str, channel_id: str) -> ConversationContext:
+        """Get conversation context"""
+        logger.info("Getting context", user_id=user_id, channel_id=channel_id)
+        
+        blob = None
+        if self.redis:
+            try:
+                blob = await self.redis.get(f"memory:{self._context_key(user_id, channel_id)}")
+            except redis.RedisError as e:
+                logger.warning("Redis read failed", error=str(e))
+        
+        return self._finish_context(user_id, channel_id, blob)
+        
+    async def get_contexts(self, keys: List[Tuple[str, str]]) -> List[ConversationContext]:
+        """Get several conversation contexts in one Redis round-trip"""
+        blobs: List[Optional[bytes]] = [None] * len(keys)
+        if self.redis and keys:
+            try:
+                blobs = await self.redis.mget([f"memory:{self._context_key(u, c)}" for u, c in keys])
+            except redis.RedisError as e:
+                logger.warning("Redis read failed", error=str(e))
+        
+        return [self._finish_context(u, c, blob) for (u, c), blob in zip(keys, blobs)]
+        
+    async def save_context(self, context: ConversationContext):
         """Save conversation context"""
-        logger.info("Saving context", user_id=context.get("userId"), channel_id=context.get("channelId"))
+        logger.info("Saving context", user_id=context.userId, channel_id=context.channelId)
+        if self.summarizer is None:
+            self._truncate_history(context)
+        key = self._context_key(context.userId, context.channelId)
+        
+        if self.redis:
+            try:
+                await self.redis.set(f"memory:{key}", self._encode_context(context), ex=MEMORY_TTL)
+            except redis.RedisError as e:
+                logger.warning("Redis write failed", error=str(e))
+                return
+            self._schedule_compaction(context)
+        
+    async def save_contexts(self, contexts: List[ConversationContext]):
+        """Save several conversation contexts in one Redis round-trip"""
+        pipe = self.redis.pipeline(transaction=False) if self.redis else None
+        for context in contexts:
+            if self.summarizer is None:
+                self._truncate_history(context)
+            key = self._context_key(context.userId, context.channelId)
+            if pipe is not None:
+                pipe.set(f"memory:{key}", self._encode_context(context), ex=MEMORY_TTL)
+        
+        if pipe is not None and contexts:
+            try:
+                await pipe.execute()
+            except redis.RedisError as e:
+                logger.warning("Redis write failed", error=str(e))
+                return
+            for context in contexts:
+                self._schedule_compaction(context)
         
     async def delete_context(self, user_id: str, channel_id: str):
         """Delete conversation context"""
         logger.info("Deleting context", user_id=user_id, channel_id=channel_id)
+        key = self._context_key(user_id, channel_id)
+        
+        if self.redis:
+            try:
+                await self.redis.delete(f"memory:{key}")
+            except redis.RedisError as e:
+                logger.warning("Redis delete failed", error=str(e))
         
     async def save(self, key: str, value: Any):
         """Save data to memory"""
         logger.info("Saving to memory", key=key)
+        if self.redis:
+            try:
+                await self.redis.set(f"memory:kv:{key}", orjson.dumps(value), ex=MEMORY_TTL)
+            except redis.RedisError as e:
+                logger.warning("Redis write failed", error=str(e))
         
     async def get(self, key: str) -> Any:
         """Get data from memory"""
         logger.info("Getting from memory", key=key)
+        if self.redis:
+            try:
+                blob = await self.redis.get(f"memory:kv:{key}")
+            except redis.RedisError as e:
+                logger.warning("Redis read failed", error=str(e))
+                return None
+            if blob is not None:
+                return orjson.loads(blob)
         return None
         
     async def delete(self, key: str):
         """Delete data from memory"""
-        logger.info("Deleting from memory", key=key) 
\ No newline at end of file
+        logger.info("Deleting from memory", key=key)
+        if self.redis:
+            try:
+                await self.redis.delete(f"memory:kv:{key}")
+            except redis.RedisError as e:
+                logger.warning("Redis delete failed", error=str(e))
@@ -1,12 +1,15 @@
 import structlog
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import time
+import orjson
 
 logger = structlog.get_logger()
 
 class ToolManager:
     def __init__(self):
         self.initialized = False
+        # Serialized catalog for /tools; the tool set is fixed after startup
+        self._tools_json: Optional[bytes] = None
         self.tools = {
             "web_search": {
                 "name": "web_search",
@@ -39,10 +42,18 @@ class ToolManager:
                 ]
             }
         }
+        # Tool name -> handler returning the tool's output
+        self._dispatch = {
+            "web_search": self._web_search,
+            "weather": self._weather,
+            "time": self._time,
+            "reminder": self._reminder
+        }
         
     async def initialize(self):
         """Initialize the tool manager"""
         logger.info("Initializing Tool Manager")
+        self._tools_json = orjson.dumps(self.get_available_tools())
         self.initialized = True
         
     async def cleanup(self):
@@ -64,47 +75,34 @@ class ToolManager:
             }
             
         # Placeholder tool execution
-        if tool_name == "web_search":
-            return {
-                "name": tool_name,
-                "input": parameters,
-                "output": f"Search results for: {parameters.get('query', '')}",
-                "success": True,
-                "error": None
-            }
-        elif tool_name == "weather":
-            return {
-                "name": tool_name,
-                "input": parameters,
-                "output": f"Weather information for: {parameters.get('location', '')}",
-                "success": True,
-                "error": None
-            }
-        elif tool_name == "time":
-            return {
-                "name": tool_name,
-                "input": parameters,
-                "output": f"Current time: {time.strftime('%Y-%m-%d %H:%M:%S')}",
-                "success": True,
-                "error": None
-            }
-        elif tool_name == "reminder":
-            return {
-                "name": tool_name,
-                "input": parameters,
-                "output": f"Reminder set: {parameters.get('message', '')} at {parameters.get('time', '')}",
-                "success": True,
-                "error": None
-            }
-        else:
-            return {
-                "name": tool_name,
-                "input": parameters,
-                "output": f"Tool '{tool_name}' executed successfully",
-                "success": True,
-                "error": None
-            }
-            
+        handler = self._dispatch.get(tool_name)
+        output = await handler(parameters) if handler else f"Tool '{tool_name}' executed successfully"
+        return {
+            "name": tool_name,
+            "input": parameters,
+            "output": output,
+            "success": True,
+            "error": None
+        }
+        
+    async def _web_search(self, parameters: Dict[str, Any]) -> str:
+        return f"Search results for: {parameters.get('query', '')}"
+        
+    async def _weather(self, parameters: Dict[str, Any]) -> str:
+        return f"Weather information for: {parameters.get('location', '')}"
+        
+    async def _time(self, parameters: Dict[str, Any], strftime=time.strftime) -> str:
+        return f"Current time: {strftime('%Y-%m-%d %H:%M:%S')}"
+        
+    async def _reminder(self, parameters: Dict[str, Any]) -> str:
+        return f"Reminder set: {parameters.get('message', '')} at {parameters.get('time', '')}"
+        
     def get_available_tools(self) -> List[Dict[str, Any]]:
         """Get list of available tools"""
-        return list(self.tools.values()) 
\ No newline at end of file
+        return list(self.tools.values()) 
+        
+    def get_available_tools_json(self) -> bytes:
+        """Get the list of available tools as JSON, serialized once"""
+        if self._tools_json is None:
+            self._tools_json = orjson.dumps(self.get_available_tools())
+        return self._tools_json
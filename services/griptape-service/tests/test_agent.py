@@ -0,0 +1,151 @@
+import asyncio
+import pytest
+
+from src import agent as agent_module
+from src.agent import CircuitBreaker, CircuitOpenError, create_agent_from_config
+
+class FakeResponse:
+    def __init__(self, status, headers=None, body=b"", content_type="application/json"):
+        self.status = status
+        self.headers = headers or {}
+        self.body = body
+        self.content_type = content_type
+        self.content = self._lines()
+    
+    async def _lines(self):
+        for line in self.body.splitlines(keepends=True):
+            yield line
+    
+    async def read(self):
+        return self.body
+    
+    def release(self):
+        pass
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        self.release()
+
+class FakeSession:
+    closed = False
+    
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.posts = 0
+    
+    async def post(self, url, headers=None, data=None):
+        self.posts += 1
+        return self.responses.pop(0)
+
+@pytest.fixture
+def model_agent(monkeypatch):
+    agent = create_agent_from_config({"MODEL_PROVIDER": "openai", "OPENAI_API_KEY": "test"})
+    agent._response_cache.clear()
+    monkeypatch.setitem(agent_module._breakers, agent.config.provider, CircuitBreaker())
+    return agent
+
+@pytest.fixture
+def anthropic_agent(monkeypatch):
+    agent = create_agent_from_config({"MODEL_PROVIDER": "anthropic", "ANTHROPIC_API_KEY": "test"})
+    agent._response_cache.clear()
+    monkeypatch.setitem(agent_module._breakers, agent.config.provider, CircuitBreaker())
+    return agent
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    
+    async def fake_sleep(delay):
+        delays.append(delay)
+    
+    monkeypatch.setattr(agent_module.asyncio, "sleep", fake_sleep)
+    return delays
+
+def history(*contents):
+    return {"history": [{"role": "user", "content": c} for c in contents]}
+
+def test_cache_key_normalizes_case_and_whitespace(model_agent):
+    assert model_agent._cache_key(model_agent._build_messages("Hi there", {})) == \
+        model_agent._cache_key(model_agent._build_messages("hi   THERE", {}))
+
+@pytest.mark.asyncio
+async def test_identical_requests_share_one_call(model_agent, monkeypatch):
+    calls = []
+    
+    async def do_request(messages):
+        calls.append(messages)
+        await asyncio.sleep(0)
+        return {"content": "reply", "model": "m", "tokens": 1, "latency": 0}
+    
+    monkeypatch.setattr(model_agent, "_do_request", do_request)
+    monkeypatch.setattr(model_agent, "_ensure_session", lambda: asyncio.sleep(0))
+    
+    first, second = await asyncio.gather(
+        model_agent.process_message("hello", {}),
+        model_agent.process_message("hello", {})
+    )
+    cached = await model_agent.process_message("hello", {})
+    assert first == second == cached
+    assert len(calls) == 1
+    
+    await model_agent.process_message("hello", history("earlier"))
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_retry_waits_at_least_retry_after(model_agent, sleeps):
+    model_agent.session = FakeSession([FakeResponse(429, {"Retry-After": "2"}), FakeResponse(200)])
+    response = await model_agent._post({})
+    assert response.status == 200
+    assert sleeps and sleeps[0] >= 2
+
+@pytest.mark.asyncio
+async def test_long_retry_after_is_returned_not_waited(model_agent, sleeps):
+    model_agent.session = FakeSession([FakeResponse(429, {"Retry-After": "3600"})])
+    response = await model_agent._post({})
+    assert response.status == 429
+    assert sleeps == []
+
+@pytest.mark.asyncio
+async def test_retry_after_past_the_deadline_is_returned(model_agent, sleeps):
+    wait = agent_module.RETRY_DEADLINE + 1
+    model_agent.session = FakeSession([FakeResponse(503, {"Retry-After": str(wait)}), FakeResponse(200)])
+    response = await model_agent._post({})
+    assert response.status == 503
+    assert sleeps == []
+
+@pytest.mark.asyncio
+async def test_breaker_opens_after_repeated_failures(model_agent, sleeps):
+    breaker = agent_module._breakers[model_agent.config.provider]
+    attempts = agent_module.MAX_RETRIES + 1
+    model_agent.session = FakeSession([FakeResponse(503)] * attempts * breaker.threshold)
+    
+    for _ in range(breaker.threshold):
+        assert (await model_agent._post({})).status == 503
+    with pytest.raises(CircuitOpenError):
+        await model_agent._post({})
+    assert model_agent.session.posts == attempts * breaker.threshold
+
+async def collect(agent, response):
+    agent.session = FakeSession([response])
+    return [delta async for delta in agent.process_message_stream("hi", {})]
+
+@pytest.mark.asyncio
+async def test_stream_yields_deltas(model_agent):
+    body = b'data: {"choices":[{"delta":{"content":"he"}}]}\n\ndata: {"choices":[{"delta":{"content":"y"}}]}\n\ndata: [DONE]\n\n'
+    assert await collect(model_agent, FakeResponse(200, body=body, content_type="text/event-stream")) == ["he", "y"]
+
+@pytest.mark.asyncio
+async def test_stream_raises_on_error_event(anthropic_agent):
+    body = (
+        b'event: content_block_delta\ndata: {"type":"content_block_delta","delta":{"text":"par"}}\n\n'
+        b'event: error\ndata: {"type":"error","error":{"type":"overloaded_error","message":"Overloaded"}}\n\n'
+    )
+    with pytest.raises(Exception, match="Overloaded"):
+        await collect(anthropic_agent, FakeResponse(200, body=body, content_type="text/event-stream"))
+
+@pytest.mark.asyncio
+async def test_stream_falls_back_to_a_whole_completion(model_agent):
+    body = b'{"choices":[{"message":{"content":"all at once"}}],"usage":{"total_tokens":3}}'
+    assert await collect(model_agent, FakeResponse(200, body=body)) == ["all at once"]
@@ -0,0 +1,126 @@
+import asyncio
+import fakeredis
+import orjson
+import pytest
+from redis.asyncio.client import Pipeline
+
+from src import memory
+from src.memory import MemoryManager
+
+def turns(*contents):
+    return [{"role": "user", "content": c, "timestamp": 0.0, "metadata": {}} for c in contents]
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeAsyncRedis()
+
+def manager(redis_client, summarizer=None):
+    manager = MemoryManager(summarizer=summarizer)
+    manager.redis = redis_client
+    return manager
+
+@pytest.mark.asyncio
+async def test_context_round_trip(redis_client):
+    memory_manager = manager(redis_client)
+    context = await memory_manager.get_context("u", "c")
+    context.history.extend(turns("hi", "there"))
+    await memory_manager.save_context(context)
+    
+    loaded = await manager(redis_client).get_context("u", "c")
+    assert loaded.model_dump() == context.model_dump()
+
+@pytest.mark.asyncio
+async def test_legacy_json_blob_is_a_miss(redis_client):
+    await redis_client.set("memory:u:c", orjson.dumps({"userId": "u", "channelId": "c", "history": turns("old")}))
+    context = await manager(redis_client).get_context("u", "c")
+    assert context.history == []
+
+@pytest.mark.asyncio
+async def test_truncates_without_summarizer(redis_client):
+    memory_manager = manager(redis_client)
+    context = await memory_manager.get_context("u", "c")
+    context.history = turns(*map(str, range(memory.MAX_RAW_TURNS + 1)))
+    await memory_manager.save_context(context)
+    assert len(context.history) == memory.MAX_RAW_TURNS // 2
+
+@pytest.mark.asyncio
+async def test_compaction_summarizes_in_background(redis_client):
+    summarized = []
+    
+    async def summarizer(old):
+        summarized.append(old)
+        return "earlier chat"
+    
+    memory_manager = manager(redis_client, summarizer)
+    context = await memory_manager.get_context("u", "c")
+    context.history = turns(*map(str, range(memory.MAX_RAW_TURNS + 1)))
+    await memory_manager.save_context(context)
+    # The caller's context is saved as-is; compaction happens afterwards
+    assert len(context.history) == memory.MAX_RAW_TURNS + 1
+    
+    context.history.extend(turns("late"))
+    await memory_manager.save_context(context)
+    await asyncio.gather(*memory_manager._compactions.values())
+    
+    stored = await memory_manager.get_context("u", "c")
+    assert len(summarized) == 1
+    assert stored.history[0]["role"] == "system"
+    assert "earlier chat" in stored.history[0]["content"]
+    assert stored.history[-1]["content"] == "late"
+    assert len(stored.history) == 1 + memory.MAX_RAW_TURNS // 2 + 1
+
+@pytest.mark.asyncio
+async def test_compaction_skips_rewritten_history(redis_client):
+    release = asyncio.Event()
+    
+    async def summarizer(old):
+        await release.wait()
+        return "stale"
+    
+    memory_manager = manager(redis_client, summarizer)
+    context = await memory_manager.get_context("u", "c")
+    context.history = turns(*map(str, range(memory.MAX_RAW_TURNS + 1)))
+    await memory_manager.save_context(context)
+    
+    await manager(redis_client).save_context(context.model_copy(update={"history": turns("replaced")}))
+    release.set()
+    await asyncio.gather(*memory_manager._compactions.values())
+    
+    stored = await memory_manager.get_context("u", "c")
+    assert [t["content"] for t in stored.history] == ["replaced"]
+
+@pytest.mark.asyncio
+async def test_compaction_keeps_a_save_that_lands_mid_write(redis_client, monkeypatch):
+    async def summarizer(old):
+        return "earlier chat"
+    
+    memory_manager = manager(redis_client, summarizer)
+    context = await memory_manager.get_context("u", "c")
+    context.history = turns(*map(str, range(memory.MAX_RAW_TURNS + 1)))
+    execute = Pipeline.execute
+    
+    async def execute_after_save(pipe, *args, **kwargs):
+        # Another worker appends a turn between the compaction's read and its write
+        monkeypatch.setattr(Pipeline, "execute", execute)
+        late = context.model_copy(update={"history": context.history + turns("late")})
+        await redis_client.set("memory:u:c", MemoryManager._encode_context(late))
+        return await execute(pipe, *args, **kwargs)
+    
+    monkeypatch.setattr(Pipeline, "execute", execute_after_save)
+    await memory_manager.save_context(context)
+    await asyncio.gather(*memory_manager._compactions.values())
+    
+    stored = await memory_manager.get_context("u", "c")
+    assert "earlier chat" in stored.history[0]["content"]
+    assert stored.history[-1]["content"] == "late"
+
+@pytest.mark.asyncio
+async def test_save_contexts_writes_every_context(redis_client):
+    memory_manager = manager(redis_client)
+    contexts = await memory_manager.get_contexts([("u", "a"), ("u", "b")])
+    for context, content in zip(contexts, ("first", "second")):
+        context.history.extend(turns(content))
+    await memory_manager.save_contexts(contexts)
+    
+    loaded = await manager(redis_client).get_contexts([("u", "a"), ("u", "b")])
+    assert [c.history[0]["content"] for c in loaded] == ["first", "second"]
@@ -0,0 +1,88 @@
+from typing import Tuple
+import numpy as np
+from numba import njit
+
+# Speech models downstream expect 16 kHz mono
+TARGET_SAMPLE_RATE = 16000
+# 30 ms frames, the frame size webrtcvad accepts at 16 kHz
+VAD_FRAME = 480
+# Bounds on the PCM layouts decode_pcm accepts
+MAX_SAMPLE_RATE = 192000
+MAX_CHANNELS = 8
+
+@njit(cache=True, fastmath=True)
+def downmix(samples, channels):
+    """Average interleaved int16 channels into mono float32 in [-1, 1)"""
+    n = samples.shape[0] // channels
+    out = np.empty(n, dtype=np.float32)
+    scale = np.float32(1.0 / (32768.0 * channels))
+    for i in range(n):
+        acc = np.float32(0.0)
+        for c in range(channels):
+            acc += samples[i * channels + c]
+        out[i] = acc * scale
+    return out
+
+@njit(cache=True, fastmath=True)
+def resample(samples, src_rate, dst_rate):
+    """Linear-interpolation resample of a mono float32 signal"""
+    if src_rate == dst_rate or samples.shape[0] == 0:
+        return samples.copy()
+    n = int(samples.shape[0] * dst_rate // src_rate)
+    out = np.empty(n, dtype=np.float32)
+    step = src_rate / dst_rate
+    last = samples.shape[0] - 1
+    for i in range(n):
+        pos = i * step
+        j = int(pos)
+        if j >= last:
+            out[i] = samples[last]
+        else:
+            frac = np.float32(pos - j)
+            out[i] = samples[j] + (samples[j + 1] - samples[j]) * frac
+    return out
+
+@njit(cache=True, fastmath=True)
+def pre_emphasis(samples, coeff=0.97):
+    """First-order high-pass filter y[n] = x[n] - coeff * x[n-1]"""
+    out = np.empty_like(samples)
+    if samples.shape[0] == 0:
+        return out
+    out[0] = samples[0]
+    for i in range(1, samples.shape[0]):
+        out[i] = samples[i] - coeff * samples[i - 1]
+    return out
+
+@njit(cache=True, fastmath=True)
+def frame_rms(samples, frame):
+    """Root-mean-square energy of each full frame"""
+    n = samples.shape[0] // frame
+    out = np.empty(n, dtype=np.float32)
+    for i in range(n):
+        acc = np.float32(0.0)
+        for k in range(i * frame, (i + 1) * frame):
+            acc += samples[k] * samples[k]
+        out[i] = np.sqrt(acc / frame)
+    return out
+
+def decode_pcm(audio: bytes, sample_rate: int, channels: int) -> np.ndarray:
+    """Turn interleaved 16-bit PCM into pre-emphasized 16 kHz mono float32"""
+    if not 0 < sample_rate <= MAX_SAMPLE_RATE or not 0 < channels <= MAX_CHANNELS:
+        raise ValueError(f"Unsupported PCM layout: {sample_rate} Hz, {channels} channels")
+    pcm = np.frombuffer(audio, dtype=np.int16, count=len(audio) // 2)
+    mono = downmix(pcm, channels)
+    return pre_emphasis(resample(mono, sample_rate, TARGET_SAMPLE_RATE))
+
+def speech_ratio(samples: np.ndarray, threshold: float = 0.02) -> float:
+    """Fraction of 30 ms frames whose energy crosses the voice threshold"""
+    rms = frame_rms(samples, VAD_FRAME)
+    return float((rms > threshold).mean()) if rms.size else 0.0
+
+def analyse_pcm(audio: bytes, sample_rate: int, channels: int) -> Tuple[int, float]:
+    """Sample count and speech ratio of a raw PCM buffer"""
+    samples = decode_pcm(audio, sample_rate, channels)
+    return len(samples), speech_ratio(samples)
+
+def warmup():
+    """Compile (or load cached) kernels so the first request doesn't pay for it"""
+    speech_ratio(decode_pcm(b"\0\0", TARGET_SAMPLE_RATE * 3, 1))
@@ -1,25 +1,31 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
 import structlog
+import asyncio
+import base64
+import orjson
+import os
+import logging
 import time
 from typing import Dict, Any
 
-# Configure logging
+from . import dsp
+
+# Configure logging: structlog writes rendered bytes straight to stdout,
+# bypassing the stdlib logging machinery
 structlog.configure(
     processors=[
-        structlog.stdlib.filter_by_level,
-        structlog.stdlib.add_logger_name,
-        structlog.stdlib.add_log_level,
-        structlog.stdlib.PositionalArgumentsFormatter(),
+        structlog.processors.add_log_level,
         structlog.processors.TimeStamper(fmt="iso"),
         structlog.processors.StackInfoRenderer(),
         structlog.processors.format_exc_info,
-        structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer()
+        structlog.processors.JSONRenderer(serializer=orjson.dumps)
     ],
-    context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
+    logger_factory=structlog.BytesLoggerFactory(),
+    wrapper_class=structlog.make_filtering_bound_logger(
+        logging.getLevelName(os.getenv("LOG_LEVEL", "info").upper())
+    ),
     cache_logger_on_first_use=True,
 )
 
@@ -29,7 +35,8 @@ logger = structlog.get_logger()
 app = FastAPI(
     title="Pipecat Voice Service",
     description="Voice service for Discord bot using Pipecat framework",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -41,10 +48,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Audio formats /audio/process can read as raw 16-bit samples
+PCM_FORMATS = {"pcm", "s16le"}
+# PCM payloads larger than this are analysed in a worker thread
+INLINE_AUDIO_BYTES = 64 * 1024
+
+# Health payload is constant apart from the timings, so it is pre-serialized
+_START_TIME = time.time()
+_HEALTH_TEMPLATE = (
+    b'{"status":"healthy","uptime":%f,"last_check":%f,"errors":[],'
+    b'"metrics":{"requestsPerMinute":0,"averageLatency":0,"errorRate":0}}'
+)
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
     logger.info("Starting Pipecat Voice Service")
+    dsp.warmup()
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -54,17 +74,8 @@ async def shutdown_event():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "uptime": time.time(),
-        "last_check": time.time(),
-        "errors": [],
-        "metrics": {
-            "requestsPerMinute": 0,
-            "averageLatency": 0,
-            "errorRate": 0
-        }
-    }
+    now = time.time()
+    return Response(content=_HEALTH_TEMPLATE % (now - _START_TIME, now), media_type="application/json")
 
 @app.post("/sessions/start")
 async def start_session(data: Dict[str, Any]):
@@ -82,6 +93,24 @@ async def stop_session(session_id: str):
 async def process_audio(data: Dict[str, Any]):
     """Process audio data"""
     logger.info("Processing audio", audio_length=len(data.get("audio", "")))
+    
+    # Raw PCM can be analysed here; encoded formats (opus) need decoding first
+    if data.get("format") in PCM_FORMATS and data.get("audio"):
+        try:
+            audio = base64.b64decode(data["audio"], validate=True)
+            sample_rate = int(data.get("sampleRate", dsp.TARGET_SAMPLE_RATE))
+            channels = int(data.get("channels", 1))
+            if len(audio) > INLINE_AUDIO_BYTES:
+                # Keep long buffers off the event loop
+                loop = asyncio.get_running_loop()
+                samples, speech_ratio = await loop.run_in_executor(None, dsp.analyse_pcm, audio, sample_rate, channels)
+            else:
+                samples, speech_ratio = dsp.analyse_pcm(audio, sample_rate, channels)
+        except (TypeError, ValueError) as e:
+            logger.warning("Invalid audio payload", error=str(e))
+            raise HTTPException(status_code=400, detail=f"Invalid audio payload: {e}")
+        logger.info("Analysed audio", samples=samples, speech_ratio=speech_ratio)
+    
     return {
         "content": "This is a placeholder voice response.",
         "tools": [],
@@ -108,4 +137,14 @@ async def get_session_info(session_id: str):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001) 
\ No newline at end of file
+    # Import string so uvicorn can spawn workers; "auto" picks uvloop and httptools
+    # when installed; structlog handles logging
+    uvicorn.run(
+        "src.main:app",
+        host="0.0.0.0",
+        port=8001,
+        loop="auto",
+        http="auto",
+        workers=int(os.getenv("WORKERS", "4")),
+        log_config=None
+    ) 
\ No newline at end of file